@@ -1,6 +1,6 @@
-﻿import re, tempfile, shutil, subprocess
+﻿import re, math, tempfile, shutil, subprocess
 from pathlib import Path
-from .utils import ffprobe_duration, sh
+from .utils import ffprobe_duration, sh, probe_key, forget_cached
 
 _silence_re_start = re.compile(r"silence_start:\s*([0-9.]+)")
 _silence_re_end   = re.compile(r"silence_end:\s*([0-9.]+)")
@@ -45,25 +45,201 @@ def find_non_silent_start(src: Path, want: float) -> float:
         start = max(0.0, dur - want - 0.2)
     return start
 
-def find_energy_peak_start(src: Path, want: float) -> float:
+_analysis_libs = None
+
+def _load_analysis_libs():
+    """Import numpy + librosa on first use; returns (np, librosa) or None if unavailable."""
+    global _analysis_libs
+    if _analysis_libs is None:
+        try:
+            import numpy as np
+            import librosa
+            _analysis_libs = (np, librosa)
+        except Exception:
+            _analysis_libs = False
+    return _analysis_libs or None
+
+def warm_up() -> bool:
+    """
+    Import librosa and run a tiny onset pass so numba compiles now, not on the first track.
+    Returns False when librosa is unavailable (analysis will fall back to silencedetect).
+    """
+    libs = _load_analysis_libs()
+    if libs is None:
+        return False
+    np, librosa = libs
     try:
-        import numpy as np
-        import librosa
+        y = np.zeros(22050, dtype=np.float32)
+        y[::2205] = 1.0
+        librosa.onset.onset_strength(y=y, sr=22050, hop_length=512)
     except Exception:
-        return find_non_silent_start(src, want)
+        pass
+    return True
+
+# Onset envelope + loudness per file, keyed like the ffprobe cache (path, mtime, size).
+_ANALYSIS_CACHE = {}
+ONSET_SR = 22050
+ONSET_HOP = 512
+
+def _k_weighting(sr: int):
+    """BS.1770 K-weighting (pre-filter shelf + RLB high-pass) as (b, a) for any sample rate."""
+    f0, G, Q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    K = math.tan(math.pi * f0 / sr)
+    Vh = 10.0 ** (G / 20.0)
+    Vb = Vh ** 0.4996667741545416
+    a0 = 1.0 + K / Q + K * K
+    pb = [(Vh + Vb * K / Q + K * K) / a0, 2.0 * (K * K - Vh) / a0, (Vh - Vb * K / Q + K * K) / a0]
+    pa = [1.0, 2.0 * (K * K - 1.0) / a0, (1.0 - K / Q + K * K) / a0]
+
+    f0, Q = 38.13547087602444, 0.5003270373238773
+    K = math.tan(math.pi * f0 / sr)
+    a0 = 1.0 + K / Q + K * K
+    rb = [1.0, -2.0, 1.0]
+    ra = [1.0, 2.0 * (K * K - 1.0) / a0, (1.0 - K / Q + K * K) / a0]
+
+    conv = lambda x, y: [sum(x[i] * y[k - i] for i in range(len(x)) if 0 <= k - i < len(y))
+                         for k in range(len(x) + len(y) - 1)]
+    return conv(pb, rb), conv(pa, ra)
 
+def _integrated_loudness(np, signal, y, sr: int, chunk_sec: float = 10.0):
+    """
+    EBU R128 / BS.1770 integrated loudness (LUFS) of y shaped (channels, samples).
+    400 ms blocks, 75% overlap, -70 LUFS absolute and -10 LU relative gates.
+    K-weighting runs in chunks (filter state carried across) to bound memory.
+    """
+    b, a = _k_weighting(sr)
+    step = int(round(0.1 * sr))
+    chunk = step * max(1, int(round(chunk_sec * 10)))   # whole 100 ms steps per chunk
+    zi = np.zeros((y.shape[0], len(a) - 1))
+    segs = []
+    for i in range(0, y.shape[-1], chunk):
+        z, zi = signal.lfilter(b, a, y[:, i : i + chunk], axis=-1, zi=zi)
+        n = z.shape[-1] // step
+        if n:
+            # mean square per 100 ms step
+            z = z[:, : n * step]
+            np.square(z, out=z)
+            segs.append(z.reshape(z.shape[0], n, step).mean(axis=-1))
+        del z
+
+    if not segs:
+        return None
+    seg = np.concatenate(segs, axis=-1)
+    if seg.shape[-1] < 4:
+        return None
+    # 4-step (400 ms) blocks summed over channels
+    blocks = (seg[:, :-3] + seg[:, 1:-2] + seg[:, 2:-1] + seg[:, 3:]) / 4.0
+    power = blocks.sum(axis=0)
+
+    with np.errstate(divide="ignore"):
+        block_lufs = -0.691 + 10.0 * np.log10(power)
+    gated = power[block_lufs > -70.0]
+    if gated.size == 0:
+        return None
+    rel = -0.691 + 10.0 * np.log10(gated.mean()) - 10.0
+    with np.errstate(divide="ignore"):
+        gated = gated[-0.691 + 10.0 * np.log10(gated) > rel]
+    if gated.size == 0:
+        return None
+    return float(-0.691 + 10.0 * np.log10(gated.mean()))
+
+def _true_peak_db(np, signal, y, sr: int, chunk_sec: float = 10.0):
+    """dBTP via 4x polyphase oversampling (2x at >= 96 kHz), in chunks to bound memory."""
+    up = 2 if sr >= 96000 else 4
+    pad = 64
+    chunk = int(chunk_sec * sr)
+    peak = 0.0
+    for i in range(0, y.shape[-1], chunk):
+        lo, hi = max(0, i - pad), min(y.shape[-1], i + chunk + pad)
+        over = signal.resample_poly(y[:, lo:hi], up, 1, axis=-1)
+        # drop the padding so chunk edges don't add filter ringing
+        over = over[:, (i - lo) * up : over.shape[-1] - (hi - min(y.shape[-1], i + chunk)) * up]
+        if over.size:
+            peak = max(peak, float(np.abs(over).max()))
+    return 20.0 * math.log10(peak) if peak > 0 else None
+
+def analyze_track(src: Path):
+    """
+    Single decode per file: onset envelope (mono, 22.05 kHz, hop 512) for snip choice, plus
+    integrated loudness and true peak measured at the native rate for normalization.
+    Returns {"oenv", "lufs", "true_peak_db"} (loudness values may be None), or None when
+    librosa is unavailable or decoding fails. Results are cached for the process.
+    """
     try:
-        y, sr = librosa.load(str(src), mono=True, sr=22050)
-        if y.size == 0:
-            return find_non_silent_start(src, want)
+        key = probe_key("analysis", src)
+    except OSError:
+        return None
+    if key in _ANALYSIS_CACHE:
+        return _ANALYSIS_CACHE[key]
+
+    libs = _load_analysis_libs()
+    if libs is None:
+        return None
+    np, librosa = libs
+    try:
+        y, sr = librosa.load(str(src), sr=None, mono=False)
+    except Exception:
+        y = None
+    if y is None or y.size == 0:
+        # remember the failure so later lookups (track_loudness) don't decode again
+        _ANALYSIS_CACHE[key] = None
+        return None
+    y = np.atleast_2d(y)
 
+    lufs = tp = None
+    try:
+        from scipy import signal
+        lufs = _integrated_loudness(np, signal, y, sr)
+        tp = _true_peak_db(np, signal, y, sr)
+    except Exception:
+        pass
+
+    try:
+        mono = librosa.to_mono(y)
+        del y  # only the mono onset signal is needed from here on
+        if sr != ONSET_SR:
+            mono = librosa.resample(mono, orig_sr=sr, target_sr=ONSET_SR)
+        oenv = librosa.onset.onset_strength(y=mono, sr=ONSET_SR, hop_length=ONSET_HOP)
+    except Exception:
+        _ANALYSIS_CACHE[key] = None
+        return None
+
+    res = {"oenv": oenv, "lufs": lufs, "true_peak_db": tp}
+    _ANALYSIS_CACHE[key] = res
+    return res
+
+def clear_analysis_cache(under: Path | None = None):
+    forget_cached(_ANALYSIS_CACHE, under)
+
+def track_loudness(src: Path):
+    """(integrated LUFS, true peak dBTP) from the analysis cache; (None, None) if unmeasured."""
+    res = analyze_track(src)
+    if not res:
+        return None, None
+    return res["lufs"], res["true_peak_db"]
+
+def loudness_gain_db(lufs, true_peak_db, target_lufs: float = -14.0, true_peak_max_db: float = -1.0) -> float:
+    """Gain to reach target_lufs without pushing true peak above true_peak_max_db (0 if unmeasured)."""
+    if lufs is None:
+        return 0.0
+    gain = target_lufs - lufs
+    if true_peak_db is not None:
+        gain = min(gain, true_peak_max_db - true_peak_db)
+    return round(gain, 2)
+
+def find_energy_peak_start(src: Path, want: float) -> float:
+    res = analyze_track(src)
+    if res is None:
+        return find_non_silent_start(src, want)
+    np, _ = _load_analysis_libs()
+
+    try:
         dur = float(ffprobe_duration(src) or 0.0)
         if want >= dur:
             return 0.0
 
-        hop = 512
-        frame_sec = hop / sr
-        oenv = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop)
+        frame_sec = ONSET_HOP / ONSET_SR
+        oenv = res["oenv"]
         win_frames = max(1, int(want / frame_sec))
         if len(oenv) <= win_frames:
             return find_non_silent_start(src, want)
@@ -88,14 +264,23 @@ def crossfade_sequence(
     inter_codec="pcm_s16le",
     threads=4,
     filter_threads=2,
+    gains_db=None,
 ):
+    """
+    gains_db: optional per-file gain (dB), applied in the same filter graph as the
+    crossfade; each file's gain is applied once, on the pass that first reads it.
+    """
+    gains = list(gains_db) if gains_db else [0.0] * len(files)
+    vol = lambda g: f",volume={g:.2f}dB" if g else ""
+
     tmpdir = Path(tempfile.mkdtemp(prefix="_xf_"))
     try:
         if not files:
             raise RuntimeError("No files to crossfade.")
         if len(files) == 1:
+            af = f'-af "volume={gains[0]:.2f}dB" ' if gains[0] else ""
             sh(
-                f'ffmpeg -y -hide_banner -i "{files[0]}" -vn -sn -dn '
+                f'ffmpeg -y -hide_banner -i "{files[0]}" -vn -sn -dn {af}'
                 f'-c:a {codec} -b:a {bitrate} -threads {threads} "{out_path}"'
             )
             return
@@ -103,12 +288,13 @@ def crossfade_sequence(
         cur = files[0]
         for idx, nxt in enumerate(files[1:], start=1):
             mid = tmpdir / f"xf_{idx:02d}.wav"
+            g0 = gains[0] if idx == 1 else 0.0
             cmd = (
                 f'ffmpeg -y -hide_banner -i "{cur}" -i "{nxt}" '
                 f'-filter_complex_threads {filter_threads} '
                 f'-filter_complex '
-                f'"[0:a]aformat=sample_rates=44100:channel_layouts=stereo,aresample=44100[a0];'
-                f'[1:a]aformat=sample_rates=44100:channel_layouts=stereo,aresample=44100[a1];'
+                f'"[0:a]aformat=sample_rates=44100:channel_layouts=stereo,aresample=44100{vol(g0)}[a0];'
+                f'[1:a]aformat=sample_rates=44100:channel_layouts=stereo,aresample=44100{vol(gains[idx])}[a1];'
                 f'[a0][a1]acrossfade=d={xfade_d}:c1=tri:c2=tri[aout]" '
                 f'-map "[aout]" -vn -sn -dn -c:a {inter_codec} -threads {threads} "{mid}"'
             )
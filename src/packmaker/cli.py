@@ -1,44 +1,65 @@
-﻿import sys, shutil, random, math
+﻿import sys, json, shutil, random, math, argparse, subprocess
 from pathlib import Path
 from .utils import need, load_yaml_min, ensure_initialized, sanitize, timestamp
-from .utils import has_encoder, sh, zip_without_sku
+from .utils import has_encoder, sh, zip_without_sku, ffprobe_duration, clear_probe_cache
 from .names import load_name_list, next_random_name
-from .preview import build_smart_snips, render_preview_video, mux_preview
-from .audio import crossfade_sequence
-from .uploader import upload_to_youtube
+from .preview import build_smart_snips, render_preview_video, mux_preview, preview_timeline, mux_video_kbps
+from .audio import crossfade_sequence, warm_up, track_loudness, loudness_gain_db, clear_analysis_cache
+from .plan import StageTimer, crossfade_cost, video_load_units
+from .plan import load_calibration, estimate_pack, check_disk, print_plan
+# uploader is imported on demand: it pulls in googleapiclient/google_auth_oauthlib.
 
 
-def main():
-    need("ffmpeg")
-    need("ffprobe")
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(prog="packmaker")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--warm", action="store_true",
+                      help="stay resident and build packs back to back (librosa, name list and probes kept loaded)")
+    mode.add_argument("--plan", action="store_true",
+                      help="estimate time and disk for the current inbox without building (exit 1 if disk is short)")
+    mode.add_argument("--promote", metavar="PACK_DIR",
+                      help="render final-quality assets for a proxy build, reusing its snips and analysis")
+    ap.add_argument("--proxy", action="store_true",
+                    help="render only a low-res review preview (no full mix/zip); finish later with --promote")
+    args = ap.parse_args(argv)
+    # --proxy applies to builds (single or --warm) only
+    if args.proxy and (args.plan or args.promote):
+        ap.error("--proxy cannot be combined with --plan or --promote")
+    return args
 
-    ROOT = Path.cwd().resolve()
-    ensure_initialized(ROOT)
-    CONF = load_yaml_min(ROOT / "config.yaml")
 
-    ASSETS = ROOT / "assets"
-    INBOX  = ROOT / "inbox"
-    OUTROOT= ROOT / CONF.get("output_root","dist")
-    PREVIEW_BG = ASSETS / "preview_bg" / "preview_bg.mp4"
+AUDIO_EXTS = {".wav",".mp3",".flac",".m4a",".aac",".ogg"}
+PROXY_MANIFEST = "proxy.json"
+PROXY_PREVIEW  = "preview_proxy.mp4"
+FPS = 30
+XFADE_PREVIEW = 0.5
+XFADE_FULL    = 2.0
 
-    title = input("Enter Pack Title (folder name): ").strip()
-    if not title: sys.exit("Pack title is required.")
-    genre = input("Enter Genre: ").strip()
-    mood  = input("Enter Mood: ").strip()
-    _ = input("Enter Thumbnail Text (optional, ignored): ").strip()
 
-    sku = f"{CONF.get('sku_prefix','PK')}-{timestamp()[-6:]}"
-    video_res    = CONF.get("video_res","1280x720")
-    preview_sec  = int(CONF.get("preview_per_track_sec",15))
-    bitrate_mp3  = CONF.get("bitrate_mp3","320k")
-    fps = 30
-    xfade_preview = 0.5
-    xfade_full    = 2.0
+def _find_tracks(INBOX: Path):
+    return sorted([p for p in INBOX.rglob("*") if p.is_file() and p.suffix.lower() in AUDIO_EXTS],
+                  key=lambda p: str(p.relative_to(INBOX)).lower())
+
+
+def _release_caches(under: Path):
+    """
+    Drop probe/analysis results for files under `under` (a pack's outputs, whose paths
+    never repeat). Entries for inputs such as inbox tracks and the background stay loaded.
+    """
+    clear_probe_cache(under)
+    clear_analysis_cache(under)
 
-    # === quality + mux settings ===
-    preview_crf    = int(CONF.get("preview_crf", 20))
-    preview_preset = str(CONF.get("preview_preset", "veryfast"))
 
+def _probe_seconds(path: Path) -> float:
+    """Container duration for timing/planning; 0.0 when ffprobe can't report one (e.g. raw ADTS)."""
+    try:
+        return float(ffprobe_duration(path) or 0.0)
+    except (subprocess.CalledProcessError, KeyError, ValueError, TypeError):
+        return 0.0
+
+
+def _mux_settings(CONF):
+    """Returns (max_size_mb, override_kbps) from config."""
     raw_size = CONF.get("preview_max_size_mb", None)
     if raw_size in (None, "", "null", "None"):
         max_size_mb = None    # no size constraint
@@ -47,7 +68,131 @@ def main():
 
     override_kbps = CONF.get("preview_mux_video_kbps", None)
     override_kbps = int(override_kbps) if override_kbps not in (None, "",) else None
-    # ==============================
+    return max_size_mb, override_kbps
+
+
+def _loudness_gains(CONF, loudness):
+    """Per-track gain (dB) from measured (lufs, true_peak) pairs; all zero when disabled."""
+    if not CONF.get("normalize_loudness", True):
+        return [0.0] * len(loudness)
+    return [
+        loudness_gain_db(lufs, tp, CONF["loudness_target_lufs"], CONF["true_peak_max_db"])
+        for lufs, tp in loudness
+    ]
+
+
+def _prompt_pack_info():
+    title = input("Enter Pack Title (folder name): ").strip()
+    if not title:
+        return None
+    genre = input("Enter Genre: ").strip()
+    mood  = input("Enter Mood: ").strip()
+    _ = input("Enter Thumbnail Text (optional, ignored): ").strip()
+    return title, genre, mood
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    need("ffmpeg")
+    need("ffprobe")
+
+    ROOT = Path.cwd().resolve()
+    ensure_initialized(ROOT)
+
+    if args.plan:
+        sys.exit(plan_pack(ROOT))
+
+    if args.promote:
+        promote_pack(ROOT, Path(args.promote))
+        return
+
+    if args.warm:
+        _warm_loop(ROOT, proxy=args.proxy)
+        return
+
+    info = _prompt_pack_info()
+    if not info: sys.exit("Pack title is required.")
+    build_pack(ROOT, *info, proxy=args.proxy)
+
+
+def _warm_loop(ROOT: Path, proxy=False):
+    """
+    Worker mode: pay the librosa/numba and name-list load once, then build packs
+    until an empty title (or EOF on stdin) is entered.
+    """
+    print("== Warming up (librosa, name list) ==")
+    if not warm_up():
+        print("librosa unavailable; snip analysis will use silencedetect.")
+    names = load_name_list(ROOT)
+    print("== Ready. Enter an empty title to exit. ==")
+    while True:
+        try:
+            info = _prompt_pack_info()
+        except EOFError:
+            break
+        if not info:
+            break
+        pool = list(names)
+        random.shuffle(pool)
+        try:
+            build_pack(ROOT, *info, name_list=pool, proxy=proxy)
+        except (Exception, SystemExit) as e:
+            print(f"!! Pack failed: {e}")
+        finally:
+            # whole output_root: also covers builds that failed before returning pack_dir
+            CONF = load_yaml_min(ROOT / "config.yaml")
+            _release_caches(ROOT / CONF.get("output_root","dist"))
+
+
+def plan_pack(ROOT: Path) -> int:
+    """
+    Dry run: probe inbox durations (no decode) and print stage estimates from the
+    calibration table. Returns 1 when the build would not fit on disk.
+    """
+    CONF = load_yaml_min(ROOT / "config.yaml")
+    INBOX  = ROOT / "inbox"
+    OUTROOT= ROOT / CONF.get("output_root","dist")
+
+    tracks = _find_tracks(INBOX)
+    if not tracks: raise SystemExit("No input audio files found in inbox/.")
+    max_size_mb, override_kbps = _mux_settings(CONF)
+
+    print(f"== Plan: probing {len(tracks)} tracks ==")
+    durations = [_probe_seconds(p) for p in tracks]
+    unknown = sum(1 for d in durations if d <= 0)
+    if unknown:
+        print(f"!! {unknown} track(s) report no duration; they are left out of the estimates.")
+    est = estimate_pack(
+        durations,
+        preview_sec=int(CONF.get("preview_per_track_sec",15)),
+        xfade_preview=XFADE_PREVIEW,
+        xfade_full=XFADE_FULL,
+        video_res=CONF.get("video_res","1280x720"),
+        fps=FPS,
+        bitrate_mp3=CONF.get("bitrate_mp3","320k"),
+        max_size_mb=max_size_mb,
+        override_video_kbps=override_kbps,
+        calibration=load_calibration(OUTROOT, match={
+            "preview_crf": int(CONF.get("preview_crf", 20)),
+            "preview_preset": str(CONF.get("preview_preset", "veryfast")),
+        }),
+    )
+    shortfalls = check_disk(est, OUTROOT)
+    print_plan(est, shortfalls)
+    return 1 if shortfalls else 0
+
+
+def build_pack(ROOT: Path, title: str, genre: str = "", mood: str = "", *, name_list=None, proxy=False):
+    CONF = load_yaml_min(ROOT / "config.yaml")
+
+    ASSETS = ROOT / "assets"
+    INBOX  = ROOT / "inbox"
+    OUTROOT= ROOT / CONF.get("output_root","dist")
+
+    sku = f"{CONF.get('sku_prefix','PK')}-{timestamp()[-6:]}"
+    preview_sec  = int(CONF.get("preview_per_track_sec",15))
+    bitrate_mp3  = CONF.get("bitrate_mp3","320k")
+    xfade_preview = XFADE_PREVIEW
 
     pack_dir   = OUTROOT / f"{sanitize(title)}_{sku}"
     tracks_dir = pack_dir / "tracks_mp3"
@@ -62,12 +207,11 @@ def main():
         src = ASSETS / fname
         if src.exists(): shutil.copy2(src, pack_dir / fname)
 
-    AUDIO_EXTS = {".wav",".mp3",".flac",".m4a",".aac",".ogg"}
-    tracks = sorted([p for p in INBOX.rglob("*") if p.is_file() and p.suffix.lower() in AUDIO_EXTS],
-                    key=lambda p: str(p.relative_to(INBOX)).lower())
+    tracks = _find_tracks(INBOX)
     if not tracks: raise SystemExit("No input audio files found in inbox/.")
 
-    name_list = load_name_list(ROOT)
+    if name_list is None:
+        name_list = load_name_list(ROOT)
     used_names = set()
 
     def to_mp3_random_into_tree(src: Path) -> Path:
@@ -79,53 +223,187 @@ def main():
         sh(f'ffmpeg -y -hide_banner -loglevel error -i "{src}" -vn -sn -dn -c:a libmp3lame -b:a {bitrate_mp3} -threads 4 "{dest}"')
         return dest
 
+    timer = StageTimer()
+
     print("== Transcoding to MP3 with random names (preserving folder tree) ==")
-    mp3_outputs = [to_mp3_random_into_tree(src) for src in tracks]
+    with timer.stage("transcode", 0.0):
+        mp3_outputs = [to_mp3_random_into_tree(src) for src in tracks]
+    # same audio length as the sources; these probes are cached and reused by snip analysis
+    mp3_durs = [_probe_seconds(p) for p in mp3_outputs]
+    timer.add_units("transcode", sum(mp3_durs))
 
     # preview audio from transcoded MP3s
-    seg_snips, preview_starts = build_smart_snips(mp3_outputs, tmp_dir, preview_sec)
+    with timer.stage("snips", sum(mp3_durs)):
+        seg_snips, preview_starts = build_smart_snips(mp3_outputs, tmp_dir, preview_sec)
+        # measured in the same decode as the snip analysis (cached), no extra pass
+        loudness = [track_loudness(p) for p in mp3_outputs]
+    gains = _loudness_gains(CONF, loudness)
+    if CONF.get("normalize_loudness", True) and any(lufs is None for lufs, _ in loudness):
+        print("Loudness not measured for some tracks (librosa/scipy unavailable?); left at original level.")
     preview_audio = tmp_dir / "preview_audio.m4a"
-    crossfade_sequence(seg_snips, preview_audio, xfade_d=xfade_preview, codec="aac", bitrate="192k",
-                       inter_codec="pcm_s16le", threads=4, filter_threads=2)
+    pa_work, _, _ = crossfade_cost([min(d, preview_sec) for d in mp3_durs], xfade_preview)
+    with timer.stage("preview_audio", pa_work):
+        crossfade_sequence(seg_snips, preview_audio, xfade_d=xfade_preview, codec="aac", bitrate="192k",
+                           inter_codec="pcm_s16le", threads=4, filter_threads=2, gains_db=gains)
 
-    N = len(mp3_outputs)
-    slot = preview_sec - xfade_preview
-    total_d_audio = preview_sec + max(0, (N - 1)) * slot
-    total_d_video = total_d_audio
-
-    video_full = render_preview_video(
-        bg_path=PREVIEW_BG,
-        tmp_dir=tmp_dir,
-        video_res=video_res,
-        fps=fps,
-        total_d_video=total_d_video,
-        N=N,
-        slot=slot,
-        preview_sec=preview_sec,
-        xfade_preview=xfade_preview,
-        amf_available=False,
-        preview_crf=preview_crf,
-        preview_preset=preview_preset,
-    )
+    if proxy:
+        _render_proxy(ROOT, CONF, pack_dir, N=len(mp3_outputs), preview_sec=preview_sec, timer=timer)
+        manifest = {
+            "title": title, "genre": genre, "mood": mood, "sku": sku,
+            "preview_sec": preview_sec,
+            "mp3_outputs": [p.relative_to(pack_dir).as_posix() for p in mp3_outputs],
+            "mp3_durs": mp3_durs,
+            "loudness": loudness,
+        }
+        (tmp_dir / PROXY_MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        timer.save(OUTROOT, tracks=len(mp3_outputs), proxy=True)
+        _release_caches(pack_dir)
+        print("\n== PROXY READY ==")
+        print(f"Review: {preview_dir / PROXY_PREVIEW}")
+        print(f"Promote: python -m packmaker.cli --promote \"{pack_dir}\"")
+        return pack_dir
 
-    preview_out = preview_dir / "preview.mp4"
+    return _finish_pack(ROOT, CONF, pack_dir, title=title, genre=genre, mood=mood,
+                        mp3_outputs=mp3_outputs, mp3_durs=mp3_durs, preview_sec=preview_sec,
+                        loudness=loudness, timer=timer)
+
+
+def _render_proxy(ROOT: Path, CONF, pack_dir: Path, *, N: int, preview_sec: int, timer):
+    """
+    Small, fast preview for review: same snips and overlay timing as the final render,
+    at proxy_res/proxy_fps with a fast preset; video is stream-copied at mux.
+    """
+    PREVIEW_BG = ROOT / "assets" / "preview_bg" / "preview_bg.mp4"
+    tmp_dir = pack_dir / "_tmp"
+    video_res = CONF.get("video_res","1280x720")
+    proxy_res = CONF.get("proxy_res", "854x480")
+    proxy_fps = int(CONF.get("proxy_fps", 15))
+    text_scale = int(proxy_res.lower().split("x")[1]) / int(video_res.lower().split("x")[1])
+
+    slot, total_d_video = preview_timeline(N, preview_sec, XFADE_PREVIEW)
+    print(f"== Proxy preview ({proxy_res} @ {proxy_fps} fps) ==")
+    with timer.stage("proxy_video", video_load_units(proxy_res, proxy_fps, total_d_video)):
+        video_proxy = render_preview_video(
+            bg_path=PREVIEW_BG,
+            tmp_dir=tmp_dir,
+            video_res=proxy_res,
+            fps=proxy_fps,
+            total_d_video=total_d_video,
+            N=N,
+            slot=slot,
+            preview_sec=preview_sec,
+            xfade_preview=XFADE_PREVIEW,
+            amf_available=False,
+            preview_crf=int(CONF.get("proxy_crf", 30)),
+            preview_preset=str(CONF.get("proxy_preset", "ultrafast")),
+            text_scale=text_scale,
+            out_name="preview_video_proxy.mp4",
+        )
     mux_preview(
-        video_full, preview_audio, preview_out, total_d_video,
-        max_size_mb=max_size_mb,
-        override_video_kbps=override_kbps,
-        audio_kbps=192,
+        video_proxy, tmp_dir / "preview_audio.m4a", pack_dir / "preview" / PROXY_PREVIEW, total_d_video,
+        max_size_mb=None,
+        audio_kbps=128,
     )
 
+
+def promote_pack(ROOT: Path, pack_dir: Path):
+    """
+    Render the final-quality preview, mix and zip for a proxy build, reusing its
+    transcoded MP3s, snip analysis and preview audio.
+    """
+    CONF = load_yaml_min(ROOT / "config.yaml")
+    pack_dir = Path(pack_dir).resolve()
+    manifest_path = pack_dir / "_tmp" / PROXY_MANIFEST
+    if not manifest_path.exists():
+        raise SystemExit(f"No proxy build found in {pack_dir} (missing _tmp/{PROXY_MANIFEST}).")
+    m = json.loads(manifest_path.read_text(encoding="utf-8"))
+
+    mp3_outputs = [pack_dir / p for p in m["mp3_outputs"]]
+    needed = mp3_outputs + [pack_dir / "_tmp" / "preview_audio.m4a"]
+    missing = [p for p in needed if not p.exists()]
+    if missing:
+        raise SystemExit(f"Proxy build is incomplete; missing {missing[0]}")
+
+    (pack_dir / "preview" / PROXY_PREVIEW).unlink(missing_ok=True)
+    (pack_dir / "_tmp" / "preview_video_proxy.mp4").unlink(missing_ok=True)
+
+    print(f"== Promoting {pack_dir.name} ==")
+    return _finish_pack(ROOT, CONF, pack_dir, title=m["title"], genre=m.get("genre", ""), mood=m.get("mood", ""),
+                        mp3_outputs=mp3_outputs, mp3_durs=m["mp3_durs"], preview_sec=int(m["preview_sec"]),
+                        loudness=m.get("loudness") or [(None, None)] * len(mp3_outputs), timer=StageTimer())
+
+
+def _finish_pack(ROOT: Path, CONF, pack_dir: Path, *, title: str, genre: str, mood: str,
+                 mp3_outputs, mp3_durs, preview_sec: int, loudness, timer):
+    """Final-quality preview video + mux, full mix, zip and (config-gated) upload."""
+    OUTROOT= ROOT / CONF.get("output_root","dist")
+    PREVIEW_BG = ROOT / "assets" / "preview_bg" / "preview_bg.mp4"
+    preview_dir= pack_dir / "preview"
+    mix_dir    = pack_dir / "mix"
+    tmp_dir    = pack_dir / "_tmp"
+    preview_audio = tmp_dir / "preview_audio.m4a"
+
+    video_res    = CONF.get("video_res","1280x720")
+    bitrate_mp3  = CONF.get("bitrate_mp3","320k")
+    fps = FPS
+    xfade_preview = XFADE_PREVIEW
+    xfade_full    = XFADE_FULL
+
+    # === quality + mux settings ===
+    preview_crf    = int(CONF.get("preview_crf", 20))
+    preview_preset = str(CONF.get("preview_preset", "veryfast"))
+    max_size_mb, override_kbps = _mux_settings(CONF)
+    # ==============================
+
+    N = len(mp3_outputs)
+    slot, total_d_video = preview_timeline(N, preview_sec, xfade_preview)
+
+    with timer.stage("preview_video", video_load_units(video_res, fps, total_d_video)):
+        video_full = render_preview_video(
+            bg_path=PREVIEW_BG,
+            tmp_dir=tmp_dir,
+            video_res=video_res,
+            fps=fps,
+            total_d_video=total_d_video,
+            N=N,
+            slot=slot,
+            preview_sec=preview_sec,
+            xfade_preview=xfade_preview,
+            amf_available=False,
+            preview_crf=preview_crf,
+            preview_preset=preview_preset,
+        )
+    timer.add_bytes("preview_video", video_full.stat().st_size)
+
+    preview_out = preview_dir / "preview.mp4"
+    reencode = mux_video_kbps(total_d_video, max_size_mb=max_size_mb,
+                              override_video_kbps=override_kbps, audio_kbps=192) is not None
+    with timer.stage("mux", total_d_video if reencode else 0.0):
+        mux_preview(
+            video_full, preview_audio, preview_out, total_d_video,
+            max_size_mb=max_size_mb,
+            override_video_kbps=override_kbps,
+            audio_kbps=192,
+        )
+
     print("== Full mix (WAV intermeds; final MP3) ==")
     mix_mp3 = mix_dir / "mix.mp3"
-    crossfade_sequence(mp3_outputs, mix_mp3, xfade_d=xfade_full, codec="libmp3lame",
-                       bitrate=bitrate_mp3, inter_codec="pcm_s16le", threads=4, filter_threads=2)
+    mix_work, _, _ = crossfade_cost(mp3_durs, xfade_full)
+    with timer.stage("mix", mix_work):
+        crossfade_sequence(mp3_outputs, mix_mp3, xfade_d=xfade_full, codec="libmp3lame",
+                           bitrate=bitrate_mp3, inter_codec="pcm_s16le", threads=4, filter_threads=2,
+                           gains_db=_loudness_gains(CONF, loudness))
 
-    zip_file = zip_without_sku(pack_dir)
+    pack_mb = sum(f.stat().st_size for f in pack_dir.rglob("*") if f.is_file()) / 1e6
+    with timer.stage("zip", pack_mb):
+        zip_file = zip_without_sku(pack_dir)
     print(f"Zipped pack to: {zip_file}")
+    timer.save(OUTROOT, tracks=N, video_res=video_res, preview_crf=preview_crf, preview_preset=preview_preset)
 
     # === YouTube upload (config-gated) ===
     if CONF.get("upload_to_youtube", False):
+        from .uploader import upload_to_youtube
+
         # sanitize privacy value
         privacy = str(CONF.get("youtube_privacy", "unlisted")).strip().lower()
         if privacy not in ("public", "unlisted", "private"):
@@ -153,8 +431,10 @@ def main():
     # =====================================
 
     shutil.rmtree(tmp_dir, ignore_errors=True)
+    _release_caches(pack_dir)
     print("\n== DONE ==")
     print(f"Pack ready: {pack_dir}")
+    return pack_dir
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,312 @@
+# src/packmaker/plan.py
+import os, json, time, shutil, statistics, tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from .preview import preview_timeline, mux_video_kbps
+
+TIMINGS_FILE = "_stage_timings.jsonl"     # appended under output_root after each build
+WAV_BYTES_PER_SEC = 44100 * 2 * 2         # crossfade intermediates: pcm_s16le, stereo, 44.1 kHz
+REF_VIDEO_LOAD = 1920 * 1080 * 30         # preview_video units are seconds of 1080p30-equivalent output
+SNIP_AUDIO_KBPS = 192                     # snips / preview audio are AAC 192k
+CALIBRATION_RUNS = 20                     # most recent runs used for the calibration table
+
+STAGES = ("transcode", "snips", "preview_audio", "preview_video", "mux", "mix", "zip")
+MATCHED_STAGES = ("preview_video",)     # rates depend on preview_crf/preview_preset
+
+# Per-unit costs used until a stage has history. Units:
+#   transcode, snips     -> seconds of source audio
+#   preview_audio, mix   -> seconds of audio decoded across all crossfade passes
+#   preview_video        -> seconds of 1080p30-equivalent output
+#   mux                  -> seconds of preview re-encoded (0 when video is stream-copied)
+#   zip                  -> MB archived
+# "bytes" is output bytes per unit and is only used for the preview render (CRF-dependent).
+DEFAULT_CALIBRATION = {
+    "transcode":     {"wall": 0.012, "cpu": 0.015},
+    "snips":         {"wall": 0.030, "cpu": 0.035},
+    "preview_audio": {"wall": 0.004, "cpu": 0.004},
+    "preview_video": {"wall": 0.60,  "cpu": 1.20, "bytes": 650_000},
+    "mux":           {"wall": 0.80,  "cpu": 3.00},
+    "mix":           {"wall": 0.004, "cpu": 0.004},
+    "zip":           {"wall": 0.030, "cpu": 0.030},
+}
+
+
+def _cpu_now():
+    """
+    CPU seconds used by this process and its finished children (ffmpeg runs as a child).
+    Child accounting is not available on Windows, so CPU is not recorded there.
+    """
+    if os.name == "nt":
+        return None
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class StageTimer:
+    """Collects wall/CPU time and work units per stage for one pack build."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str, units: float):
+        t0, c0 = time.perf_counter(), _cpu_now()
+        try:
+            yield
+        finally:
+            rec = self.stages.setdefault(name, {"units": 0.0, "wall": 0.0, "cpu": 0.0})
+            rec["units"] += float(units)
+            rec["wall"] += time.perf_counter() - t0
+            c1 = _cpu_now()
+            if c0 is None or c1 is None or rec["cpu"] is None:
+                rec["cpu"] = None
+            else:
+                rec["cpu"] += c1 - c0
+
+    def add_units(self, name: str, units: float):
+        """For stages whose work units are only known once they finish."""
+        rec = self.stages.setdefault(name, {"units": 0.0, "wall": 0.0, "cpu": 0.0})
+        rec["units"] += float(units)
+
+    def add_bytes(self, name: str, nbytes: int):
+        rec = self.stages.setdefault(name, {"units": 0.0, "wall": 0.0, "cpu": 0.0})
+        rec["bytes"] = rec.get("bytes", 0) + int(nbytes)
+
+    def save(self, out_root: Path, **meta):
+        out_root.mkdir(parents=True, exist_ok=True)
+        line = {"ts": time.time(), **meta, "stages": self.stages}
+        with (out_root / TIMINGS_FILE).open("a", encoding="utf-8") as f:
+            f.write(json.dumps(line) + "\n")
+
+
+def load_calibration(out_root: Path, max_runs: int = CALIBRATION_RUNS, match: dict | None = None):
+    """
+    Per-unit wall/CPU/bytes rates: median over the last `max_runs` recorded builds that ran
+    each stage, falling back to DEFAULT_CALIBRATION for stages without history.
+    `match` (e.g. preview_crf/preview_preset) restricts the preview_video stage to runs with
+    the same settings, or uses all runs when none match.
+    Each stage also gets "runs" (number of samples behind the figures).
+    """
+    runs = []
+    path = out_root / TIMINGS_FILE
+    if path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+
+    table = {}
+    for name in STAGES:
+        recs = [(run, (run.get("stages") or {}).get(name)) for run in runs]
+        recs = [(run, rec) for run, rec in recs if rec and rec.get("units")]
+        if name in MATCHED_STAGES and match:
+            same = [(run, rec) for run, rec in recs if all(run.get(k) == v for k, v in match.items())]
+            recs = same or recs
+
+        samples = {"wall": [], "cpu": [], "bytes": []}
+        for _, rec in recs[-max_runs:]:
+            for k in samples:
+                if rec.get(k) is not None:
+                    samples[k].append(rec[k] / rec["units"])
+        default = DEFAULT_CALIBRATION[name]
+        row = {"runs": len(samples["wall"])}
+        row["wall"] = statistics.median(samples["wall"]) if samples["wall"] else default["wall"]
+        if samples["cpu"]:
+            row["cpu"] = statistics.median(samples["cpu"])
+        else:
+            # keep the default CPU:wall ratio when only wall time is known
+            row["cpu"] = row["wall"] * default["cpu"] / default["wall"]
+        if "bytes" in default:
+            row["bytes"] = statistics.median(samples["bytes"]) if samples["bytes"] else default["bytes"]
+        table[name] = row
+    return table
+
+
+def crossfade_cost(durations, xfade_d: float):
+    """
+    Mirrors audio.crossfade_sequence: each pass decodes the running mix plus the next
+    track into a new WAV, and the WAVs are only removed at the end.
+    Returns (decoded_seconds, output_seconds, peak_temp_bytes).
+    """
+    durations = [max(0.0, float(d)) for d in durations]
+    if not durations:
+        return 0.0, 0.0, 0
+    cur = durations[0]
+    work, temp = 0.0, 0
+    for nxt in durations[1:]:
+        work += cur + nxt
+        cur = max(0.0, cur + nxt - min(xfade_d, cur, nxt))
+        temp += int(cur * WAV_BYTES_PER_SEC)
+    work += cur  # final encode
+    return work, cur, temp
+
+
+def _kbps(bitrate) -> int:
+    s = str(bitrate).strip().lower()
+    if s.endswith("k"):
+        return int(float(s[:-1]))
+    if s.endswith("m"):
+        return int(float(s[:-1]) * 1000)
+    return int(float(s) / 1000)
+
+
+def video_load_units(video_res: str, fps: int, seconds: float) -> float:
+    """Seconds of 1080p30-equivalent video (the preview_video calibration unit)."""
+    w, h = str(video_res).lower().split("x")
+    return seconds * int(w) * int(h) * fps / REF_VIDEO_LOAD
+
+
+def estimate_pack(
+    durations,
+    *,
+    preview_sec: float,
+    xfade_preview: float,
+    xfade_full: float,
+    video_res: str,
+    fps: int,
+    bitrate_mp3: str,
+    max_size_mb: int | None,
+    override_video_kbps: int | None,
+    calibration: dict,
+    audio_kbps: int = SNIP_AUDIO_KBPS,
+):
+    """
+    Estimate per-stage wall/CPU time, output and temp disk for one build from source
+    durations alone. Timeline math is the same as the build (preview_timeline).
+    """
+    N = len(durations)
+    total_src = float(sum(durations))
+    slot, total_d_video = preview_timeline(N, preview_sec, xfade_preview)
+    mp3_Bps = _kbps(bitrate_mp3) * 1000 / 8
+    snip_Bps = audio_kbps * 1000 / 8
+
+    snip_lens = [min(float(d), float(preview_sec)) for d in durations]
+    pa_work, pa_out_sec, pa_temp = crossfade_cost(snip_lens, xfade_preview)
+    mix_work, mix_out_sec, mix_temp = crossfade_cost(durations, xfade_full)
+
+    video_units = video_load_units(video_res, fps, total_d_video)
+    video_full_bytes = int(video_units * calibration["preview_video"]["bytes"])
+    vkbps = mux_video_kbps(total_d_video, max_size_mb=max_size_mb,
+                           override_video_kbps=override_video_kbps, audio_kbps=audio_kbps)
+    if vkbps is None:
+        preview_bytes = video_full_bytes + int(total_d_video * snip_Bps)
+    else:
+        preview_bytes = int(total_d_video * (vkbps + audio_kbps) * 1000 / 8 * 1.02)
+
+    mp3_bytes = int(total_src * mp3_Bps)
+    snips_bytes = int(sum(snip_lens) * snip_Bps)
+    pa_bytes = int(pa_out_sec * snip_Bps)
+    mix_bytes = int(mix_out_sec * mp3_Bps)
+    # the zip is taken before _tmp is removed, so it includes the preview intermediates
+    pack_tmp = snips_bytes + pa_bytes + video_full_bytes
+    zip_bytes = mp3_bytes + pack_tmp + preview_bytes + mix_bytes
+
+    units = {
+        "transcode": total_src,
+        "snips": total_src,
+        "preview_audio": pa_work,
+        "preview_video": video_units,
+        "mux": total_d_video if vkbps is not None else 0.0,
+        "mix": mix_work,
+        "zip": zip_bytes / 1e6,
+    }
+    out_bytes = {
+        "transcode": mp3_bytes, "snips": snips_bytes, "preview_audio": pa_bytes,
+        "preview_video": video_full_bytes, "mux": preview_bytes, "mix": mix_bytes, "zip": zip_bytes,
+    }
+    temp_bytes = {"preview_audio": pa_temp, "mix": mix_temp}
+
+    stages = []
+    for name in STAGES:
+        cal = calibration[name]
+        stages.append({
+            "stage": name,
+            "units": units[name],
+            "wall": units[name] * cal["wall"],
+            "cpu": units[name] * cal["cpu"],
+            "out_bytes": out_bytes[name],
+            "temp_bytes": temp_bytes.get(name, 0),
+            "runs": cal["runs"],
+        })
+
+    # output_root peaks at zip time; system temp peaks during the full-mix crossfade
+    out_peak = mp3_bytes + pack_tmp + preview_bytes + mix_bytes + zip_bytes
+    temp_peak = max(pa_temp, mix_temp)
+    same_device_peak = max(out_peak, mp3_bytes + pack_tmp + preview_bytes + mix_temp + mix_bytes)
+
+    return {
+        "tracks": N,
+        "source_seconds": total_src,
+        "slot": slot,
+        "total_d_video": total_d_video,
+        "mix_seconds": mix_out_sec,
+        "stages": stages,
+        "wall": sum(s["wall"] for s in stages),
+        "cpu": sum(s["cpu"] for s in stages),
+        "output_peak_bytes": out_peak,
+        "temp_peak_bytes": temp_peak,
+        "same_device_peak_bytes": same_device_peak,
+        "final_bytes": mp3_bytes + preview_bytes + mix_bytes + zip_bytes,
+    }
+
+
+def _existing(path: Path) -> Path:
+    path = Path(path)
+    while not path.exists() and path.parent != path:
+        path = path.parent
+    return path
+
+
+def check_disk(est: dict, out_root: Path, temp_dir: Path | None = None, margin: float = 1.10):
+    """
+    Compare estimated peaks with free space. Returns a list of (label, need, free) shortfalls.
+    """
+    out_dir = _existing(out_root)
+    tmp = _existing(temp_dir or Path(tempfile.gettempdir()))
+    out_free = shutil.disk_usage(out_dir).free
+    short = []
+    if os.stat(out_dir).st_dev == os.stat(tmp).st_dev:
+        need = int(est["same_device_peak_bytes"] * margin)
+        if need > out_free:
+            short.append((f"{out_dir} (output + temp)", need, out_free))
+        return short
+    need = int(est["output_peak_bytes"] * margin)
+    if need > out_free:
+        short.append((str(out_dir), need, out_free))
+    tmp_free = shutil.disk_usage(tmp).free
+    need = int(est["temp_peak_bytes"] * margin)
+    if need > tmp_free:
+        short.append((str(tmp), need, tmp_free))
+    return short
+
+
+def _fmt_secs(s: float) -> str:
+    s = int(round(s))
+    h, rem = divmod(s, 3600)
+    m, sec = divmod(rem, 60)
+    return f"{h}:{m:02d}:{sec:02d}" if h else f"{m}:{sec:02d}"
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def print_plan(est: dict, shortfalls):
+    print(f"Tracks: {est['tracks']}  source audio: {_fmt_secs(est['source_seconds'])}  "
+          f"preview: {_fmt_secs(est['total_d_video'])} (slot {est['slot']:.2f}s)  "
+          f"mix: {_fmt_secs(est['mix_seconds'])}")
+    print(f"{'stage':<14}{'wall':>10}{'cpu':>10}{'output':>12}{'temp':>12}{'runs':>6}")
+    for s in est["stages"]:
+        print(f"{s['stage']:<14}{_fmt_secs(s['wall']):>10}{_fmt_secs(s['cpu']):>10}"
+              f"{_fmt_bytes(s['out_bytes']):>12}{_fmt_bytes(s['temp_bytes']):>12}{s['runs']:>6}")
+    print(f"{'total':<14}{_fmt_secs(est['wall']):>10}{_fmt_secs(est['cpu']):>10}")
+    print(f"Peak disk: output {_fmt_bytes(est['output_peak_bytes'])}, "
+          f"system temp {_fmt_bytes(est['temp_peak_bytes'])}; "
+          f"left after build {_fmt_bytes(est['final_bytes'])}")
+    for label, need, free in shortfalls:
+        print(f"!! Not enough disk on {label}: need ~{_fmt_bytes(need)}, free {_fmt_bytes(free)}")
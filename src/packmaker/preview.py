@@ -31,10 +31,61 @@ def build_smart_snips(sources, out_dir: Path, sec: int):
     return snips, starts
 
 
-def _make_filter_chain(*, video_res: str, N: int, slot: float, preview_sec: float, xfade_preview: float) -> str:
+def preview_timeline(N: int, preview_sec: float, xfade_preview: float):
+    """
+    Returns (slot, total_d_video): per-track index spacing and total preview length.
+    """
+    slot = preview_sec - xfade_preview
+    total_d_audio = preview_sec + max(0, (N - 1)) * slot
+    return slot, total_d_audio
+
+
+def mux_video_kbps(
+    total_d_video: float,
+    *,
+    max_size_mb: int | None,
+    override_video_kbps: int | None = None,
+    audio_kbps: int = 192,
+) -> int | None:
+    """
+    Video bitrate mux_preview will encode at, or None when it stream-copies video.
+    """
+    # Practical encoder caps
+    MAX_FFMPEG_KBPS = 2_147_483        # ~2.147e9 bps (int32 cap in kbps)
+    SOFT_CAP_KBPS   = 100_000          # 100 Mbps upper soft cap for sanity
+
+    # --- Mode 1: explicit bitrate override ---
+    if override_video_kbps and override_video_kbps > 0:
+        vkbps = int(override_video_kbps)
+        return max(200, min(vkbps, SOFT_CAP_KBPS, MAX_FFMPEG_KBPS))
+
+    # --- Mode 3: no size constraint -> stream-copy video ---
+    if max_size_mb is None:
+        return None
+
+    # --- Mode 2: size-targeted bitrate (float math + clamps) ---
+    max_bytes_total = int(max_size_mb) * 1024 * 1024
+    audio_bits = int(audio_kbps * 1000 * max(total_d_video, 0.001))
+    container_overhead_bits = int(max_bytes_total * 8 * 0.02)  # ~2%
+    available_video_bits = max(1, max_bytes_total * 8 - audio_bits - container_overhead_bits)
+
+    # Use float seconds to avoid integer truncation
+    seconds = max(0.001, float(total_d_video))
+    vkbps = int(available_video_bits / seconds / 1000.0)  # bits -> kbps
+
+    # Clamp to sane/FFmpeg ranges
+    return max(200, min(vkbps, SOFT_CAP_KBPS, MAX_FFMPEG_KBPS))
+
+
+def _make_filter_chain(
+    *, video_res: str, N: int, slot: float, preview_sec: float, xfade_preview: float, text_scale: float = 1.0
+) -> str:
     """
     Filter chain: ONLY centered, time-sliced numbers (01..N).
+    text_scale shrinks the index text for proxy renders so it matches the final layout.
     """
+    fontsize = max(8, round(200 * text_scale))
+    borderw  = max(1, round(6 * text_scale))
     font_path_raw = windows_fontfile()               # e.g., C:\Windows\Fonts\arial.ttf
     fontfile = ffmpeg_escape_fontfile(font_path_raw)
 
@@ -49,7 +100,7 @@ def _make_filter_chain(*, video_res: str, N: int, slot: float, preview_sec: floa
         nxt   = f"v{idx+1}"
         parts.append(
             f"[{prev}]drawtext=fontfile='{fontfile}':text='{label}':"
-            f"fontcolor=white:borderw=6:bordercolor=black:fontsize=200:"
+            f"fontcolor=white:borderw={borderw}:bordercolor=black:fontsize={fontsize}:"
             f"x=(w-tw)/2:y=(h-th)/2:enable=between(t\\,{start}\\,{end})[{nxt}]"
         )
         prev = nxt
@@ -100,16 +151,19 @@ def render_preview_video(
     *,
     preview_crf: int = 20,
     preview_preset: str = "veryfast",
+    text_scale: float = 1.0,
+    out_name: str = "preview_video_full.mp4",
     **_kwargs,
 ) -> Path:
     """
     Build preview video with quality controls (CRF + preset).
     """
     tmp_dir.mkdir(parents=True, exist_ok=True)
-    video_full = tmp_dir / "preview_video_full.mp4"
+    video_full = tmp_dir / out_name
 
     filter_chain = _make_filter_chain(
-        video_res=video_res, N=N, slot=slot, preview_sec=preview_sec, xfade_preview=xfade_preview
+        video_res=video_res, N=N, slot=slot, preview_sec=preview_sec, xfade_preview=xfade_preview,
+        text_scale=text_scale,
     )
 
     # Try 1) stream_loop, 2) concat, 3) solid color
@@ -179,28 +233,15 @@ def mux_preview(
     """
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # Practical encoder caps
-    MAX_FFMPEG_KBPS = 2_147_483        # ~2.147e9 bps (int32 cap in kbps)
-    SOFT_CAP_KBPS   = 100_000          # 100 Mbps upper soft cap for sanity
-
-    # --- Mode 1: explicit bitrate override ---
-    if override_video_kbps and override_video_kbps > 0:
-        vkbps = int(override_video_kbps)
-        vkbps = max(200, min(vkbps, SOFT_CAP_KBPS, MAX_FFMPEG_KBPS))
-        subprocess.run([
-            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-            "-i", str(video_full), "-i", str(preview_audio),
-            "-map", "0:v", "-map", "1:a",
-            "-c:v", "libx264", "-b:v", f"{vkbps}k",
-            "-maxrate", f"{vkbps}k", "-bufsize", f"{vkbps*2}k",
-            "-c:a", "aac", "-b:a", f"{audio_kbps}k",
-            "-movflags", "+faststart", "-shortest",
-            str(out_path)
-        ], check=True)
-        return
+    vkbps = mux_video_kbps(
+        total_d_video,
+        max_size_mb=max_size_mb,
+        override_video_kbps=override_video_kbps,
+        audio_kbps=audio_kbps,
+    )
 
     # --- Mode 3: no size constraint -> stream-copy video, encode audio only ---
-    if max_size_mb is None:
+    if vkbps is None:
         subprocess.run([
             "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
             "-i", str(video_full), "-i", str(preview_audio),
@@ -212,19 +253,7 @@ def mux_preview(
         ], check=True)
         return
 
-    # --- Mode 2: size-targeted bitrate (float math + clamps) ---
-    max_bytes_total = int(max_size_mb) * 1024 * 1024
-    audio_bits = int(audio_kbps * 1000 * max(total_d_video, 0.001))
-    container_overhead_bits = int(max_bytes_total * 8 * 0.02)  # ~2%
-    available_video_bits = max(1, max_bytes_total * 8 - audio_bits - container_overhead_bits)
-
-    # Use float seconds to avoid integer truncation
-    seconds = max(0.001, float(total_d_video))
-    vkbps = int(available_video_bits / seconds / 1000.0)  # bits -> kbps
-
-    # Clamp to sane/FFmpeg ranges
-    vkbps = max(200, min(vkbps, SOFT_CAP_KBPS, MAX_FFMPEG_KBPS))
-
+    # --- Modes 1/2: fixed override or size-targeted bitrate ---
     subprocess.run([
         "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
         "-i", str(video_full), "-i", str(preview_audio),
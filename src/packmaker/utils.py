@@ -45,10 +45,19 @@ def load_yaml_min(path: Path):
     conf.setdefault("video_res", "1280x720")
     conf.setdefault("bitrate_mp3", "320k")
     conf.setdefault("wav_bit_depth", 24)
+    conf.setdefault("upload_to_youtube", False)
+    conf.setdefault("normalize_loudness", True)
+    conf.setdefault("loudness_target_lufs", -14.0)
+    conf.setdefault("true_peak_max_db", -1.0)
     if isinstance(conf["make_mp3"], str): conf["make_mp3"] = conf["make_mp3"].lower() == "true"
     if isinstance(conf["make_wav"], str): conf["make_wav"] = conf["make_wav"].lower() == "true"
+    if isinstance(conf["upload_to_youtube"], str): conf["upload_to_youtube"] = conf["upload_to_youtube"].lower() == "true"
+    if isinstance(conf["normalize_loudness"], str): conf["normalize_loudness"] = conf["normalize_loudness"].lower() == "true"
     try: conf["preview_per_track_sec"] = int(conf["preview_per_track_sec"])
     except: pass
+    for k in ("loudness_target_lufs", "true_peak_max_db"):
+        try: conf[k] = float(conf[k])
+        except: pass
     return conf
 
 def ensure_initialized(root: Path):
@@ -72,7 +81,44 @@ wav_bit_depth: 24
             encoding="utf-8"
         )
 
+# Probe results keyed by (resolved path, mtime, size); lives as long as the process,
+# so a warm worker reuses them across pack builds.
+_PROBE_CACHE = {}
+
+def probe_key(kind: str, path: Path):
+    """Cache key for per-file results: changes when the file is rewritten."""
+    p = Path(path)
+    st = p.stat()
+    return (kind, str(p.resolve()), st.st_mtime_ns, st.st_size)
+
+def _cached_probe(kind: str, path: Path, probe):
+    try:
+        key = probe_key(kind, path)
+    except OSError:
+        return probe(path)
+    if key not in _PROBE_CACHE:
+        _PROBE_CACHE[key] = probe(path)
+    return _PROBE_CACHE[key]
+
+def forget_cached(cache: dict, under: Path | None = None):
+    """Drop entries of a probe_key-keyed cache for files under `under` (all entries if None)."""
+    if under is None:
+        cache.clear()
+        return
+    root = Path(under).resolve()
+    for key in [k for k in cache if Path(k[1]).is_relative_to(root)]:
+        del cache[key]
+
+def clear_probe_cache(under: Path | None = None):
+    forget_cached(_PROBE_CACHE, under)
+
 def ffprobe_duration(path: Path) -> float:
+    return _cached_probe("duration", path, _ffprobe_duration)
+
+def ffprobe_video_duration(path: Path) -> float:
+    return _cached_probe("video_duration", path, _ffprobe_video_duration)
+
+def _ffprobe_duration(path: Path) -> float:
     r = subprocess.run(
         f'ffprobe -v error -show_entries format=duration -of json "{path}"',
         shell=True, capture_output=True, text=True, check=True
@@ -80,7 +126,7 @@ def ffprobe_duration(path: Path) -> float:
     j = json.loads(r.stdout)
     return float(j["format"]["duration"])
 
-def ffprobe_video_duration(path: Path) -> float:
+def _ffprobe_video_duration(path: Path) -> float:
     r = subprocess.run(
         f'ffprobe -v error -show_entries format=duration -of default=nw=1:nk=1 "{path}"',
         shell=True, capture_output=True, text=True, check=True